@@ -1,19 +1,23 @@
 from mqtt_service import MqttService
-import time
+import asyncio
 
 
-def main():
+async def main():
     mqtt = MqttService()
+    service = asyncio.create_task(mqtt.run())
 
 
     n = 0
-    while (n < 12345624):
+    while (n < 12345624 and not mqtt.shutdown_event.is_set()):
 
-        mqtt.send_status("start_main")
+        await mqtt.send_status("start_main")
         n += 1
-        time.sleep(1)
+        await asyncio.sleep(1)
+
+    mqtt.shutdown_event.set()
+    await service
 
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    asyncio.run(main())
@@ -1,20 +1,26 @@
 from utils.logging_helper import set_logger
 from utils.settings_loader import load_settings
 from services.git_service import GitService
-from queue import Queue, Empty
-import subprocess
 import sys
 import os
 import signal
-import time
-import platform
-import paho.mqtt.client as mqtt
-import json
-import threading
-import psutil
+import asyncio
+import aiomqtt
+import orjson
 
 SETTINGS_PATH = 'settings_local.yaml'
 RUN_CODE = 'main.py'
+RECONNECT_INTERVAL = 5
+STATUS_FLUSH_INTERVAL = 0.05
+OUTPUT_CHUNK_SIZE = 4096
+
+
+def _get_mqtt_params(mqtt: dict, api_key) -> dict:
+    """Return a copy of the mqtt settings with 'api_key_' placeholders replaced by api_key."""
+    return {
+        key: value.replace('api_key_', f'{api_key}') if isinstance(value, str) else value
+        for key, value in mqtt.items()
+    }
 
 class MqttService:
     broker: str
@@ -29,199 +35,271 @@ class MqttService:
     need_time_command : list[str] = ["start_main", "stop_main", "git_update", "checkUpdated"]
     logger = set_logger('MQTT')
 
+    # Encoded once for the status transitions every command goes through
+    _status_payloads: dict[str, bytes] = {
+        status: orjson.dumps({"type": "status", "status": status})
+        for status in [
+            "stopped",
+            "running:main",
+            *[f"busy:Processing {command}" for command in need_time_command],
+            *[f"Command '{command}' completed, system no longer busy" for command in need_time_command],
+        ]
+    }
+
 
     def __init__(self, setting_path = SETTINGS_PATH):
         self.settings = load_settings(setting_path)
+        self.api_key = self.settings.get('api_key')
+
+        if not self.api_key:
+            self.logger.error('API Key is not set')
         
+        # Resolve api_key placeholders before anything reads the broker or topics
         self.mqtt = self.settings.get('mqtt', {})
-        self.broker = self.mqtt.get('broker', '')
-        self.port = self.mqtt.get('port', '')
-        self.topic = self.mqtt.get('topic', '')
-        self.status_topic = self.mqtt.get('status_topic', '')
-        self.output_topic = self.mqtt.get('output_topic', '')
-        self.control_topic = self.mqtt.get('control_topic', '')
+        self._mqtt_resolved = _get_mqtt_params(self.mqtt, self.api_key)
+        self.broker = self._mqtt_resolved.get('broker', '')
+        self.port = self._mqtt_resolved.get('port', '')
+        self.topic = self._mqtt_resolved.get('topic', '')
+        self.status_topic = self._mqtt_resolved.get('status_topic', '')
+        self.output_topic = self._mqtt_resolved.get('output_topic', '')
+        self.control_topic = self._mqtt_resolved.get('control_topic', '')
+        self.logger.info(f'Broker: {self.broker}')
+        self.logger.info(f'Port: {self.port}')
+        self.logger.info(f'Topic: {self.topic}')
+        self.logger.info(f'Status Topic: {self.status_topic}')
+        self.logger.info(f'Output Topic: {self.output_topic}')
+        self.logger.info(f'Control Topic: {self.control_topic}')
+
         self.is_running = False
-        self.client = None
-        self.process: subprocess.Popen = None
-        self.Bulid_client()
+        self.client: aiomqtt.Client = None
+        self.loop: asyncio.AbstractEventLoop = None
+        self.process: asyncio.subprocess.Process = None
+        self.output_task: asyncio.Task = None
+        self._status_buffer: list[bytes] = []
+        self._status_flush_task: asyncio.Task = None
         self.current_app = {'name': 'main', 'code': RUN_CODE}
+        self._git = GitService()
 
 
         self.init_command_queue()
-        self.start_command_worker()
-
-
 
-    def _get_mqtt_params(self):
-        api_key = self.settings.get('api_key')
 
-        if not api_key:
-            self.logger.error('API Key is not set')
-
-        for key, value in self.mqtt.items():
-            if isinstance(value, str) and 'api_key_' in value:
-                value = value.replace('api_key_', f'{api_key}')
-            setattr(self, key, value)
-
-        self.logger.info(f'Broker: {self.broker}')
-        self.logger.info(f'Port: {self.port}')
-        self.logger.info(f'Topic: {self.topic}')
-        self.logger.info(f'Status Topic: {self.status_topic}')
-        self.logger.info(f'Output Topic: {self.output_topic}')
-        self.logger.info(f'Control Topic: {self.control_topic}')
 
     def Bulid_client(self):
-        self.client = mqtt.Client()
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
+        return aiomqtt.Client(self.broker, self.port, keepalive=60)
+
+    async def run(self):
+        """Run the MQTT client and the command worker on the current event loop until shutdown."""
+        self.loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.shutdown_event.set)
+            except NotImplementedError:
+                # Signal handlers are not supported by the Windows event loop
+                pass
 
+        self.start_command_worker()
+        self.client_task = asyncio.create_task(self.client_loop())
         try:
-            self.client.connect(self.broker, self.port, 60)
-            self.client.loop_start()
-            self.logger.info(f'Connected to MQTT broker')
-        except Exception as e:
-            self.logger.error(f'Failed to connect to MQTT broker: {e}')
+            await self.shutdown_event.wait()
+        finally:
+            await self.cleanup()
+
+    async def client_loop(self):
+        while not self.shutdown_event.is_set():
+            try:
+                async with self.Bulid_client() as client:
+                    self.client = client
+                    await self.on_connect(client)
+                    await self.on_message(client)
+            except aiomqtt.MqttError as e:
+                self.logger.error(f'Failed to connect to MQTT broker: {e}')
+            except Exception as e:
+                # Keep reconnecting, a dead client task would leave the service deaf
+                self.logger.error(f'Error in MQTT client loop: {e}')
+            finally:
+                self.client = None
+            await asyncio.sleep(RECONNECT_INTERVAL)
 
-    def on_connect(self, client, userdata, flags, rc):
-        self._get_mqtt_params()
+    async def on_connect(self, client):
         self.logger.info(f'Connected to MQTT broker')
-        client.subscribe(self.control_topic)
+        await client.subscribe(self.control_topic)
 
-    def on_message(self, client, userdata, msg):
-    
-        command_dict = json.loads(msg.payload.decode())
-        command = command_dict.get("command")
-        self.logger.info(f"Received command: {command}")
-        
-        # Check queue size before adding
-        if self.command_queue.qsize() >= 10:  # Leave some buffer
-            self.logger.warning(f"Command queue is nearly full, rejecting command: {command}")
-            self._send_status(f"error:Command queue full - try again later")
-            return
-        
-        # Queue the command for processing by the worker thread
-        client_info = {"client": client, "userdata": userdata}
-        try:
-            self.command_queue.put((command_dict, client_info), timeout=1.0)
-            self.logger.debug(f"Command '{command}' queued for processing (queue size: {self.command_queue.qsize()})")
-        except:
-            self.logger.error(f"Failed to queue command '{command}' - queue timeout")
-            self.send_status(f"error:Failed to queue command - system busy")
+    async def on_message(self, client):
+        async for msg in client.messages:
+            try:
+                command_dict = orjson.loads(msg.payload)
+            except ValueError as e:
+                self.logger.error(f"Invalid command payload: {e}")
+                continue
+            if not isinstance(command_dict, dict):
+                self.logger.error(f"Invalid command payload: expected a JSON object, got {type(command_dict).__name__}")
+                continue
+            command = command_dict.get("command")
+            self.logger.info(f"Received command: {command}")
+            
+            # Check queue size before adding
+            if self.command_queue.qsize() >= 10:  # Leave some buffer
+                self.logger.warning(f"Command queue is nearly full, rejecting command: {command}")
+                await self.send_status(f"error:Command queue full - try again later")
+                continue
+            
+            # Queue the command for processing by the worker task
+            try:
+                await asyncio.wait_for(self.command_queue.put((command_dict, None)), timeout=1.0)
+                self.logger.debug(f"Command '{command}' queued for processing (queue size: {self.command_queue.qsize()})")
+            except asyncio.TimeoutError:
+                self.logger.error(f"Failed to queue command '{command}' - queue timeout")
+                await self.send_status(f"error:Failed to queue command - system busy")
 
     def init_command_queue(self):
-        self.command_lock = threading.Lock()
-        self.command_queue = Queue(maxsize = 50)
-        self.command_worker_thread = None
-        self.is_busy = False
-        self.shutdown_event = threading.Event()
+        self.command_queue = asyncio.Queue(maxsize = 50)
+        self.command_worker_task = None
+        self.client_task = None
+        self._busy = asyncio.Event()
+        self.shutdown_event = asyncio.Event()
         self.max_command_timeout = 300
 
     def start_command_worker(self):
-        self.command_worker_thread = threading.Thread(target = self.command_worker, daemon = True)
-        self.command_worker_thread.start()
-        self.logger.info("Command worker thread started")
-
-    def command_worker(self):
-        while not self.shutdown_event.is_set():
-            try:
-                command_data = self.command_queue.get(timeout = 0.1)
+        self.command_worker_task = asyncio.create_task(self.command_worker())
+        self.logger.info("Command worker task started")
 
-                self.process_command(command_data)
+    async def command_worker(self):
+        # Sleeps on the queue until a command arrives, cleanup() cancels the task
+        while True:
+            command_data = await self.command_queue.get()
 
-                self.command_queue.task_done()
-            
-            except Empty:
-                continue
+            try:
+                await self.process_command(command_data)
             except Exception as e:
                 self.logger.error(f"Error in command worker: {e}")
+            finally:
+                self.command_queue.task_done()
         
-    def process_command(self, command_data):
+    async def process_command(self, command_data):
         command_dict, client_info = command_data
         command = command_dict.get("command")
 
-        if self.is_busy and command in self.need_time_command:
+        if self._busy.is_set() and command in self.need_time_command:
             self.logger.warning(f"Rejecting command '{command}' - system is busy")
-            self.send_status(f"busy:Cannot process {command} - system is currently busy")
+            await self.send_status(f"busy:Cannot process {command} - system is currently busy")
             return
 
+        # command_worker is the only consumer of command_queue, so commands are
+        # already serialized and the busy flag only changes on this task
         try:
-            with self.command_lock:
-
-                if command in self.need_time_command:
-                    self.is_busy = True
-                    self.send_status(f"busy:Processing {command}")
-                
-                self.logger.info(f"Processing command: {command}")
+            if command in self.need_time_command:
+                self._busy.set()
+                await self.send_status(f"busy:Processing {command}")
+            
+            self.logger.info(f"Processing command: {command}")
 
-                if command == "start_main":
-                    #self.start_main()未實現函數
-                    pass
-                elif command == "stop_main":
-                    #self.stop_main()未實現函數
-                    pass
-                elif command in ["git_update", "checkUpdated"]:
-                    git_service = GitService()
-                    git_service.update()
-                else:
-                    self.logger.warning(f'Unknown Command: {command}')
+            if command == "start_main":
+                #self.start_main()未實現函數
+                pass
+            elif command == "stop_main":
+                #self.stop_main()未實現函數
+                pass
+            elif command in ["git_update", "checkUpdated"]:
+                status = await self._git.update()
+                if status["status"] == "updated":
+                    self.logger.info("Code updated, restarting application...")
+                    if self.is_running:
+                        await self.stop_main()
+                    await self.start_main()
+                await self.send_status(orjson.dumps(status).decode())
+            else:
+                self.logger.warning(f'Unknown Command: {command}')
 
         except Exception as e:
             self.logger.error(f"Error in process command '{command}':{e}")
-            self.send_status(f"error:Failed to process {command} - {str(e)}")
+            await self.send_status(f"error:Failed to process {command} - {str(e)}")
 
         finally:
-            if self.is_busy:
-                self.is_busy = False
-                self.send_status(f"Command '{command}' completed, system no longer busy")
+            if self._busy.is_set():
+                self._busy.clear()
+                await self.send_status(f"Command '{command}' completed, system no longer busy")
             
-    def send_status(self, status: str):
-        status_dict = {
-            "type": "status",
-            "status" : status
-        }
-        self.client.publish(self.status_topic, json.dumps(status_dict))
-
-    def stream_output(self):
-        while self.is_running and self._process and self._process.poll() is None:
+    async def send_status(self, status: str):
+        payload = self._status_payloads.get(status)
+        if payload is None:
+            status_dict = {
+                "type": "status",
+                "status" : status
+            }
+            payload = orjson.dumps(status_dict)
+        # Statuses sent in quick succession are coalesced into one publish
+        self._status_buffer.append(payload)
+        if self._status_flush_task is None:
+            self._status_flush_task = asyncio.create_task(self._flush_status())
+
+    async def _flush_status(self):
+        try:
+            await asyncio.sleep(STATUS_FLUSH_INTERVAL)
+            buffer, self._status_buffer = self._status_buffer, []
+
+            if self.client is None:
+                self.logger.warning(f"Not connected to MQTT broker, dropping {len(buffer)} status message(s)")
+                return
+            # A single status keeps the plain object payload, several are sent as a JSON array
+            payload = buffer[0] if len(buffer) == 1 else b'[' + b','.join(buffer) + b']'
             try:
-                output = self.process.stdout.readline()
-                if output:
-                    output = output.strip()
-                    self.client.publish(self.output_topic, output)
-            except Exception as e:
-                self.logger.error(f"Error reading output: {e}")
-                break
-            time.sleep(0.1)
+                await self.client.publish(self.status_topic, payload)
+            except aiomqtt.MqttError as e:
+                self.logger.error(f"Failed to publish status: {e}")
+        finally:
+            # Cleared only once the publish is done, so cleanup can wait for it
+            self._status_flush_task = None
+            if self._status_buffer:
+                # Statuses queued while publishing get their own flush
+                self._status_flush_task = asyncio.create_task(self._flush_status())
+
+    async def _pump_stdout(self, stdout: asyncio.StreamReader):
+        # Read raw chunks and split lines here, so a very long line never hits the
+        # StreamReader line limit. read() returns b'' on EOF once the application exits.
+        pending = b''
+        try:
+            while chunk := await stdout.read(OUTPUT_CHUNK_SIZE):
+                *lines, pending = (pending + chunk).split(b'\n')
+                for line in lines:
+                    await self._publish_output(line.strip())
+            if pending:
+                await self._publish_output(pending.strip())
+        except Exception as e:
+            self.logger.error(f"Error reading output: {e}")
+
+    async def _publish_output(self, output: bytes):
+        if self.client is None:
+            return
+        try:
+            await self.client.publish(self.output_topic, output)
+        except aiomqtt.MqttError as e:
+            self.logger.error(f"Failed to publish output: {e}")
 
 
 
 
-    def kill_process_tree(self, pid):
+    async def kill_process_tree(self, pid, timeout=3):
+        """Terminate the application's process group, escalating to SIGKILL after timeout seconds."""
+        # start_main runs the application in its own session, so signalling the
+        # group reaches every child. Reaping goes through process.wait() so the
+        # asyncio child watcher still sees the exit status.
         try:
-            parent = psutil.Process(pid)
-            children = parent.children(recursive=True)
-            for child in children:
-                try:
-                    child.terminate()
-                except psutil.NoSuchProcess:
-                    pass
-            gone, alive = psutil.wait_procs(children, timeout=3)
-            for p in alive:
-                try:
-                    p.kill()
-                except psutil.NoSuchProcess:
-                    pass
+            pgid = os.getpgid(pid)
+            os.killpg(pgid, signal.SIGTERM)
             try:
-                parent.terminate()
-                parent.wait(timeout=3)
-            except psutil.NoSuchProcess:
+                await asyncio.wait_for(self.process.wait(), timeout=timeout)
+                return
+            except asyncio.TimeoutError:
                 pass
-        except psutil.NoSuchProcess:
+            os.killpg(pgid, signal.SIGKILL)
+            await self.process.wait()
+        except (ProcessLookupError, PermissionError):
             pass
         except Exception as e:
-            print(f"Error killing process tree: {e}")
+            self.logger.error(f"Error killing process tree: {e}")
 
-    def graceful_shutdown_unix(self):
+    async def graceful_shutdown_unix(self):
         """Gracefully shutdown application on Unix systems (Linux/macOS)."""
         try:
             pgid = os.getpgid(self.process.pid)
@@ -230,33 +308,33 @@ class MqttService:
             self.logger.info("Sending SIGINT for graceful shutdown...")
             try:
                 os.killpg(pgid, signal.SIGINT)
-                self.process.wait(timeout=8)  # Wait up to 8 seconds for graceful shutdown
+                await asyncio.wait_for(self.process.wait(), timeout=8)  # Wait up to 8 seconds for graceful shutdown
                 self.logger.info("Process terminated gracefully with SIGINT")
                 return
-            except subprocess.TimeoutExpired:
+            except asyncio.TimeoutError:
                 self.logger.info("SIGINT timeout, trying SIGTERM...")
             
             # Step 2: Send SIGTERM if SIGINT didn't work
             try:
                 os.killpg(pgid, signal.SIGTERM)
-                self.process.wait(timeout=5)  # Wait up to 5 seconds for SIGTERM
+                await asyncio.wait_for(self.process.wait(), timeout=5)  # Wait up to 5 seconds for SIGTERM
                 self.logger.info("Process terminated with SIGTERM")
                 return
-            except subprocess.TimeoutExpired:
+            except asyncio.TimeoutError:
                 self.logger.info("SIGTERM timeout, force killing process...")
             
-            # Step 3: Force kill if nothing else worked
-            self.kill_process_tree(self.process.pid)
+            # Step 3: Force kill if nothing else worked, SIGTERM already had its chance
+            await self.kill_process_tree(self.process.pid, timeout=0)
             
-        except psutil.NoSuchProcess:
+        except ProcessLookupError:
             self.logger.info("Process already terminated")
         except Exception as e:
             self.logger.error(f"Error during Unix graceful shutdown: {e}")
             # Fall back to force kill
-            self._kill_process_tree(self.process.pid)
+            await self.kill_process_tree(self.process.pid)
 
 
-    def start_main(self, app_code=None):
+    async def start_main(self, app_code=None):
         if self.is_running:
             self.logger.info("Application is already running!")
             return
@@ -264,80 +342,76 @@ class MqttService:
         if app_code is None:
             app_code = self.current_app['code']
         try:
-            kwargs = {
-                'stdout': subprocess.PIPE,
-                'stderr': subprocess.STDOUT,
-                'universal_newlines': True,
-                'bufsize': 1,
-                'encoding': 'utf-8',  #Prevent encoding error from output
-                'errors': 'replace'
-            }
-            kwargs['preexec_fn'] = os.setsid
-
-            self.process = subprocess.Popen([sys.executable, app_code, '--settings', SETTINGS_PATH], **kwargs)
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, app_code, '--settings', SETTINGS_PATH,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                preexec_fn=os.setsid,
+            )
             self.is_running = True
             self.logger.info(f"Application ({app_code}) started successfully!")
-            self.send_status(f"running:{self.current_app['name']}")
+            await self.send_status(f"running:{self.current_app['name']}")
 
-            self.output_thread = threading.Thread(target=self.stream_output)
-            self.output_thread.daemon = True
-            self.output_thread.start()
+            self.output_task = asyncio.create_task(self._pump_stdout(self.process.stdout))
 
         except Exception as e:
             self.logger.error(f"Error starting application: {e}")
             self.is_running = False
-            self.send_status(f"error:{str(e)}")
+            await self.send_status(f"error:{str(e)}")
 
 
-    def stop_main(self):
+    async def stop_main(self):
         if not self.is_running or not self.process:
             self.logger.info("Application is not running!")
             return
 
         try:
 
-            self.graceful_shutdown_unix()
+            await self.graceful_shutdown_unix()
 
             self.logger.info("Application stopped successfully!")
-            self.send_status("stopped")
+            await self.send_status("stopped")
         except Exception as e:
             self.logger.error(f"Error stopping application: {e}")
-            self.send_status(f"error:{str(e)}")
+            await self.send_status(f"error:{str(e)}")
         finally:
             self.is_running = False
             self.process = None
-            if self.output_thread:
-                self.output_thread.join(timeout=1)
+            if self.output_task:
+                try:
+                    await asyncio.wait_for(self.output_task, timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+                self.output_task = None
 
 
-    def cleanup(self):
+    async def cleanup(self):
         
         self.logger.info("Performing cleanup...")
         
-        # Signal shutdown to command worker thread
+        # Signal shutdown to command worker task
         self.shutdown_event.set()
         
         # Wait for pending commands to complete (with timeout)
         try:
-            # Wait for the queue to be empty (but not indefinitely)
-            timeout_start = time.time()
-            while not self.command_queue.empty() and (time.time() - timeout_start) < 5.0:
-                time.sleep(0.1)
-            
-            # Wait for worker thread to finish
-            if self.command_worker_thread and self.command_worker_thread.is_alive():
-                self.command_worker_thread.join(timeout=3.0)
-                if self.command_worker_thread.is_alive():
-                    self.logger.warning("Command worker thread did not shutdown gracefully")
-        except Exception as e:
-            self.logger.error(f"Error during command worker cleanup: {e}")
+            await asyncio.wait_for(self.command_queue.join(), timeout=5.0)
+        except asyncio.TimeoutError:
+            self.logger.warning("Command worker did not finish pending commands in time")
+        
+        if self.command_worker_task:
+            self.command_worker_task.cancel()
+            await asyncio.gather(self.command_worker_task, return_exceptions=True)
         
         if self.is_running:
-            self.stop_main()
-        if self.client:
+            await self.stop_main()
+        while self._status_flush_task:
+            # Publish any buffered statuses before disconnecting
+            await asyncio.gather(self._status_flush_task, return_exceptions=True)
+        if self.client_task:
             try:
-                self.client.loop_stop()
-                self.client.disconnect()
+                # Leaving the client context disconnects from the broker
+                self.client_task.cancel()
+                await asyncio.gather(self.client_task, return_exceptions=True)
             except Exception as e:
                 self.logger.error(f"Error during MQTT cleanup: {e}")
         self.logger.info("Cleanup complete")
@@ -354,29 +428,15 @@ def main():
 
     mqtt = MqttService()
 
-
-    def signal_handler(signum, frame):
-        print("\nReceived termination signal. Cleaning up...")
-        mqtt.cleanup()
-        sys.exit(0)
-
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-
     try:
-        while True:
-            time.sleep(1)
+        asyncio.run(mqtt.run())
 
     except KeyboardInterrupt:
         print("\nReceived keyboard interrupt. Cleaning up...")
-        mqtt.cleanup()
         sys.exit(0)
     except Exception as e:
         print(f"An error occurred: {e}")
-        mqtt.cleanup()
         sys.exit(1)
-    finally:
-        mqtt.cleanup()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
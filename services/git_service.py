@@ -1,62 +1,94 @@
 from utils.logging_helper import set_logger
 import os
 import platform
-import subprocess
-import json
-
+import asyncio
+import shutil
 
 
+# Resolved once so each git call skips the PATH search
+_GIT_BIN = shutil.which('git') or 'git'
+# Never wait on a credential prompt, and skip git's locale setup
+_GIT_ENV_OVERRIDES = {'GIT_TERMINAL_PROMPT': '0', 'LC_ALL': 'C'}
 
 
 class GitService:
 
     def __init__(self):
         self.logger = set_logger("GitService")
+        self._repo_path = os.path.abspath(os.path.dirname(__file__))
+        # Detect the original user
+        self.orig_user = os.environ.get('SUDO_USER') or os.environ.get('USER')
+
+    def _git_cmd(self, args):
+        if platform.system() != 'Windows':
+            # Only check geteuid on Unix
+            if hasattr(os, 'geteuid') and os.geteuid() == 0 and self.orig_user and self.orig_user != 'root':
+                # sudo resets the environment, so pass the overrides through env
+                overrides = [f'{k}={v}' for k, v in _GIT_ENV_OVERRIDES.items()]
+                return ['sudo', '-u', self.orig_user, 'env'] + overrides + args
+            return args
+        # On Windows, just run as current user
+        return args
+
+    async def _run_git_cmd(self, args):
+        """Run a git command without blocking the event loop, returns (returncode, stdout, stderr)."""
+        proc = await asyncio.create_subprocess_exec(
+            *self._git_cmd(args),
+            cwd=self._repo_path,
+            env={**os.environ, **_GIT_ENV_OVERRIDES},
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+        return proc.returncode, stdout.decode(errors='replace').strip(), stderr.decode(errors='replace').strip()
+
+    async def get_current_commit(self):
+        _, commit, _ = await self._run_git_cmd([_GIT_BIN, 'rev-parse', 'HEAD'])
+        return commit
+
+    async def get_commits(self):
+        """Return (HEAD, upstream) from one rev-parse, upstream is None if the branch has none."""
+        returncode, out, _ = await self._run_git_cmd([_GIT_BIN, 'rev-parse', 'HEAD', '@{u}'])
+        commits = out.splitlines()
+        head = commits[0] if commits else ''
+        upstream = commits[1] if returncode == 0 and len(commits) > 1 else None
+        return head, upstream
+
+    async def fetch(self):
+        _, _, fetch_err = await self._run_git_cmd([_GIT_BIN, 'fetch', '--quiet'])
+        if fetch_err:
+            self.logger.warning(f"Git fetch error: {fetch_err}")
+
+    async def pull(self):
+        _, pull_out, pull_err = await self._run_git_cmd([_GIT_BIN, 'pull', '--ff-only'])
+        self.logger.info(f"Git pull output: {pull_out}")
+        if pull_err:
+            self.logger.warning(f"Git pull error: {pull_err}")
+        return pull_out
+
+    async def update(self):
+        """Pull the latest code, returns a status dict with 'status' ('updated' or 'no_update') and 'commit'."""
+        self.logger.info(f"Starting git update in {self._repo_path}")
+        self.logger.info(f"Running git as user: {self.orig_user}")
+
+        # Fetch first so the common "no update" case skips the working tree update of git pull
+        await self.fetch()
+        cur_commit, upstream_commit = await self.get_commits()
+        self.logger.info(f"Current commit: {cur_commit}")
+        self.logger.info(f"Upstream commit: {upstream_commit}")
+        if upstream_commit == cur_commit:
+            self.logger.info("No update detected.")
+            return {"status": "no_update", "commit": cur_commit}
+
+        await self.pull()
+
+        new_commit = await self.get_current_commit()
+        self.logger.info(f"New commit: {new_commit}")
+
+        if cur_commit != new_commit:
+            self.logger.info("Code updated")
+            return {"status": "updated", "commit": new_commit}
+        self.logger.info("No update detected.")
+        return {"status": "no_update", "commit": new_commit}
 
-    def git_update(self):
-        try:
-            path = os.path.abspath(os.path.dirname(__file__))
-            self.logger.info(f"Starting git update in {path}")
-
-            # Detect the original user
-            orig_user = os.environ.get('SUDO_USER') or os.environ.get('USER')
-            self.logger.info(f"Running git as user: {orig_user}")
-
-            def run_git_cmd(args):
-                if platform.system() != 'Windows':
-                    # Only check geteuid on Unix
-                    if hasattr(os, 'geteuid') and os.geteuid() == 0 and orig_user and orig_user != 'root':
-                        cmd = ['sudo', '-u', orig_user] + args
-                    else:
-                        cmd = args
-                else:
-                    # On Windows, just run as current user
-                    cmd = args
-                return subprocess.run(cmd, cwd=path, capture_output=True, text=True)
-
-            cur_commit = run_git_cmd(['git', 'rev-parse', 'HEAD']).stdout.strip()
-            self.logger.info(f"Current commit: {cur_commit}")
-
-            pull_proc = run_git_cmd(['git', 'pull', '--ff-only'])
-            pull_out = pull_proc.stdout.strip()
-            pull_err = pull_proc.stderr.strip()
-            self.logger.info(f"Git pull output: {pull_out}")
-            if pull_err:
-                self.logger.warning(f"Git pull error: {pull_err}")
-
-            new_commit = run_git_cmd(['git', 'rev-parse', 'HEAD']).stdout.strip()
-            self.logger.info(f"New commit: {new_commit}")
-
-            if cur_commit != new_commit:
-                self.logger.info("Code updated, restarting application...")
-                if self.is_running:
-                    self.stop_main()
-                self.start_main()
-                status = {"status": "updated", "commit": new_commit}
-            else:
-                self.logger.info("No update detected.")
-                status = {"status": "no_update", "commit": new_commit}
-            self.send_status(json.dumps(status))
-        except Exception as e:
-            self.logger.error(f"Error during git update: {e}")
-            self.send_status(f"error:{str(e)}")
\ No newline at end of file
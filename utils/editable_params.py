@@ -1,3 +1,25 @@
+from dataclasses import dataclass
+
+
+@dataclass(slots=True, frozen=True)
+class EditableParam:
+    name: str
+    path: tuple[str, ...]
+    type: str
+    description: str
+    example: str
+
+    def to_dict(self) -> dict:
+        """Same shape as the editable_params_list entries"""
+        return {
+            'name': self.name,
+            'path': list(self.path),
+            'type': self.type,
+            'description': self.description,
+            'example': self.example,
+        }
+
+
 editable_params_list = [
     {
         'name': 'TARGET_FC_2G',
@@ -104,4 +126,16 @@ editable_params_list = [
         'description': 'Uploader Broker',
         'example': '140.112.45.232'
     }
-]
\ No newline at end of file
+]
+
+# Lookup by parameter name, paths are stored as tuples
+EDITABLE_PARAMS: dict[str, EditableParam] = {
+    p['name']: EditableParam(
+        name=p['name'],
+        path=tuple(p['path']),
+        type=p['type'],
+        description=p['description'],
+        example=p['example'],
+    )
+    for p in editable_params_list
+}
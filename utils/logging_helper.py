@@ -1,6 +1,5 @@
 import logging
 import sys
-import platform
 
 # Color constants
 RESET_COLOR = '\033[0m'
@@ -21,11 +20,13 @@ def get_logger_color(title: str):
     return LOG_COLORS.get(title, WHITE_COLOR)
 
 
+# Titles whose logger already has our handler attached
+_configured: set[str] = set()
+
+
 def set_logger(title: str):
-    if platform.system() == "Windows":
-        use_windows_logging = False
-    else:
-        use_windows_logging = False
+    if title in _configured:
+        return logging.getLogger(title)
 
     logger = logging.getLogger(title)
     logger.setLevel(logging.INFO)
@@ -34,10 +35,12 @@ def set_logger(title: str):
         # handler = logging.StreamHandler()
         # Only log to stdout since tee will handle writing to file
         handler = logging.StreamHandler(sys.stdout)
-        formatter = logging.Formatter(f'%(asctime)s - {get_logger_color(title)}%(name)15s - %(levelname)s - %(message)s{RESET_COLOR}')
+        color = get_logger_color(title)
+        formatter = logging.Formatter(f'%(asctime)s - {color}%(name)15s - %(levelname)s - %(message)s{RESET_COLOR}', style='%')
         handler.setFormatter(formatter)
         # Prevent propagation to avoid duplicate logging(specially for linux)
-        logger.propagate = use_windows_logging
+        logger.propagate = False
         logger.addHandler(handler)
 
+    _configured.add(title)
     return logger
\ No newline at end of file
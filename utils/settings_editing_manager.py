@@ -6,14 +6,215 @@ Tracks and logs all settings changes with timestamps using YAML multi-document f
 
 import yaml
 import os
+import io
+import mmap
+import time
+import sys
+import shutil
+import tempfile
+import warnings
+import functools
+import copy
 from datetime import datetime
+from collections.abc import Mapping
 from typing import Dict, Any, List, Optional
 from utils.logging_helper import set_logger
-from utils.settings_loader import load_settings
-from utils.editable_params import editable_params_list
+from utils.settings_loader import load_settings, cache_settings
+from utils.editable_params import editable_params_list, EDITABLE_PARAMS
+
+# libyaml backed loader/dumper when available
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+# Every YAML write in this module uses the same emitter options
+_dump = functools.partial(yaml.dump, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+
+# numpy is optional, it only speeds up parsing long list_float values
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HISTORY_BUFFER_SIZE = 1 << 16
+# Shorter list_float strings are faster to parse in pure Python
+NUMPY_LIST_MIN_CHARS = 1024
+# record_edit_batched flushes once either limit is reached
+BATCH_MAX_RECORDS = 64
+BATCH_MAX_BYTES = 1 << 16
+
+def _yaml_scalar(value: Any) -> Optional[str]:
+    """YAML text for a plain scalar, or None if the value needs the full emitter"""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if value != value:
+            return '.nan'
+        if value in (float('inf'), float('-inf')):
+            return '.inf' if value > 0 else '-.inf'
+        # Same as PyYAML: YAML 1.1 floats need a '.' before any exponent
+        text = repr(value)
+        if '.' not in text and 'e' in text:
+            text = text.replace('e', '.0e', 1)
+        return text
+    if isinstance(value, str) and value.isprintable():
+        return "'" + value.replace("'", "''") + "'"
+    return None
+
+
+def _format_edit(record: dict) -> str:
+    """Serialize an edit record as one YAML document, without going through the YAML emitter for plain values"""
+    lines = []
+    for key, value in record.items():
+        text = _yaml_scalar(value)
+        if text is None and isinstance(value, list):
+            items = [_yaml_scalar(v) for v in value]
+            if None not in items:
+                text = '[' + ', '.join(items) + ']'
+        if text is None:
+            # Nested or unusual values are rare, let PyYAML handle them
+            lines.append(_dump({key: value}))
+        else:
+            lines.append(f"{key}: {text}\n")
+    lines.append("---\n")  # Document separator
+    return ''.join(lines)
+
+
+_BOOL_TRUE = frozenset({'true', '1', 'yes'})
+_BOOL_FALSE = frozenset({'false', '0', 'no'})
+
+
+def _parse_bool(value_str: str) -> bool:
+    value = value_str.lower()
+    if value in _BOOL_TRUE:
+        return True
+    if value in _BOOL_FALSE:
+        return False
+    raise ValueError(f"Invalid boolean value: {value_str}")
+
+
+def _parse_list_float(value_str: str) -> List[float]:
+    # Handle list format like [1.0, 2.0, 3.0] or "1.0,2.0,3.0"
+    if value_str.startswith('[') and value_str.endswith(']'):
+        value_str = value_str[1:-1]
+    if np is not None and len(value_str) >= NUMPY_LIST_MIN_CHARS:
+        # Long lists (e.g. calibration curves) are parsed in C. Malformed input
+        # only warns in numpy, so treat that as an error and let the Python
+        # parser below handle it with its usual leniency and error message.
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            try:
+                return np.fromstring(value_str, sep=',').tolist()
+            except (ValueError, DeprecationWarning):
+                pass
+    return [float(x) for x in value_str.split(',') if x.strip()]
+
+
+def _parse_string(value_str: str) -> str:
+    return value_str
+
+
+# param type -> parser for values given as strings
+_PARSERS = {
+    'int': int,
+    'float': float,
+    'bool': _parse_bool,
+    'string': _parse_string,
+    'list_float': _parse_list_float,
+}
+
+
+def _copy_file(src: str, dst: str):
+    """Copy src to dst like shutil.copy2, using an in-kernel os.sendfile copy on Linux"""
+    if not (sys.platform.startswith('linux') and hasattr(os, 'sendfile')):
+        shutil.copy2(src, dst)
+        return
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT, 0o666)
+        try:
+            src_st = os.fstat(src_fd)
+            dst_st = os.fstat(dst_fd)
+            # Truncate only once we know dst is not src, like copy2's SameFileError
+            if (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino):
+                raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+            os.ftruncate(dst_fd, 0)
+            size = src_st.st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dst)
+
+
+def _make_accessors(path):
+    """Build (getter, setter) closures for a fixed settings path"""
+    keys = tuple(path)
+    parents, last = keys[:-1], keys[-1]
+
+    def getter(settings, _keys=keys):
+        current = settings
+        try:
+            for key in _keys:
+                current = current[key]
+        except (KeyError, TypeError):
+            return None
+        return current
+
+    def setter(settings, value, _parents=parents, _last=last):
+        current = settings
+        for key in _parents:
+            current = current.setdefault(key, {})
+        current[_last] = value
+
+    return getter, setter
+
+
+class _EditableView(Mapping):
+    """Editable param values looked up lazily from a settings dict"""
+
+    __slots__ = ('_settings', '_accessors_by_name')
+
+    def __init__(self, settings: dict, accessors_by_name: dict):
+        self._settings = settings
+        self._accessors_by_name = accessors_by_name
+
+    def __getitem__(self, name: str):
+        value = self._accessors_by_name[name][0](self._settings)
+        # settings is the loader's shared cache, never hand out its mutable objects
+        if isinstance(value, (list, dict)):
+            return copy.deepcopy(value)
+        return value
+
+    def __iter__(self):
+        return iter(self._accessors_by_name)
+
+    def __len__(self):
+        return len(self._accessors_by_name)
+
+    def __repr__(self):
+        return repr(dict(self))
+
 
 class SettingsEditingManager:
     """Manages settings editing history using YAML multi-document format for efficient append-only logging"""
+
+    __slots__ = (
+        'settings_file', 'settings', 'history_file', 'logger', 'editable_params_list',
+        '_accessors_by_name', '_accessors_by_path', '_history_fp', '_ts_second', '_ts_prefix',
+        '_pending', '_pending_size',
+    )
     
     def __init__(self, settings_file: str = 'settings_local.yaml', history_file: str = 'settings_local_edit_history.yaml'):
         """
@@ -28,27 +229,83 @@ class SettingsEditingManager:
         self.history_file = history_file
         self.logger = set_logger('SettingsEditingManager')
         self.editable_params_list = editable_params_list
+        # Paths are fixed, so each param gets prebuilt (getter, setter) accessors.
+        # Kept apart from the param info so get_parameter_info stays plain data.
+        self._accessors_by_name = {name: _make_accessors(param.path) for name, param in EDITABLE_PARAMS.items()}
+        self._accessors_by_path = {param.path: self._accessors_by_name[name] for name, param in EDITABLE_PARAMS.items()}
         
         # Ensure history file exists with header
         self._ensure_history_file()
+        # Kept open for appends, flushed when the buffer fills or on flush()/close()
+        self._history_fp = open(self.history_file, 'a', buffering=HISTORY_BUFFER_SIZE, encoding='utf-8')
+        # Cached second-resolution prefix for _timestamp
+        self._ts_second = 0
+        self._ts_prefix = ''
+        # Serialized records from record_edit_batched waiting for flush_batch
+        self._pending: list[bytes] = []
+        self._pending_size = 0
 
-    def get_settings(self):
-        return load_settings(self.settings_file)
+    def flush(self, sync: bool = False):
+        """Write buffered edit records to the history file, fsync as well if sync is True"""
+        self.flush_batch()
+        self._history_fp.flush()
+        if sync:
+            os.fsync(self._history_fp.fileno())
+
+    def flush_sync(self):
+        """Flush buffered edit records and fsync the history file"""
+        self.flush(sync=True)
+
+    def close(self):
+        """Flush and close the history file"""
+        fp = getattr(self, '_history_fp', None)
+        if fp is not None and not fp.closed:
+            self.flush_batch()
+            fp.close()
+
+    def __del__(self):
+        self.close()
+
+    def get_settings(self, readonly: bool = False, refresh: bool = False):
+        return load_settings(self.settings_file, readonly=readonly, refresh=refresh)
     
+    def _history_header(self) -> str:
+        """Header document that starts every history file"""
+        header = {
+            "version": "1.0",
+            "created_at": datetime.now().isoformat(),
+            "settings_file": self.settings_file,
+            "description": "Settings edit history log (YAML multi-document format)"
+        }
+        return _dump(header) + "---\n"  # Document separator
+
     def _ensure_history_file(self):
         """Ensure the history file exists with proper header"""
         if not os.path.exists(self.history_file):
-            header = {
-                "version": "1.0",
-                "created_at": datetime.now().isoformat(),
-                "settings_file": self.settings_file,
-                "description": "Settings edit history log (YAML multi-document format)"
-            }
-            with open(self.history_file, 'w') as f:
-                yaml.dump(header, f, default_flow_style=False, sort_keys=False)
-                f.write("---\n")  # Document separator
+            with open(self.history_file, 'w', encoding='utf-8') as f:
+                f.write(self._history_header())
             self.logger.info(f"Created new history file: {self.history_file}")
     
+    def _timestamp(self) -> str:
+        """Local time in isoformat, the seconds part is only formatted once per second"""
+        ns = time.time_ns()
+        sec, frac = divmod(ns, 1_000_000_000)
+        if sec != self._ts_second:
+            self._ts_second = sec
+            self._ts_prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(sec))
+        return f"{self._ts_prefix}.{frac // 1000:06d}"
+
+    def _make_edit_record(self, param_name: str, old_value: Any, new_value: Any, user: str, source: str) -> dict:
+        return {
+            "timestamp": self._timestamp(),
+            "param_name": param_name,
+            "old_value": old_value,
+            "new_value": new_value,
+            "user": user,
+            "source": source,
+            "settings_file": self.settings_file
+        }
+
     def record_edit(self, param_name: str, old_value: Any, new_value: Any, 
                    user: str = "unknown", source: str = "unknown") -> bool:
         """
@@ -66,20 +323,12 @@ class SettingsEditingManager:
             bool: True if successfully recorded, False otherwise
         """
         try:
-            edit_record = {
-                "timestamp": datetime.now().isoformat(),
-                "param_name": param_name,
-                "old_value": old_value,
-                "new_value": new_value,
-                "user": user,
-                "source": source,
-                "settings_file": self.settings_file
-            }
+            edit_record = self._make_edit_record(param_name, old_value, new_value, user, source)
             
-            # Simply append the new document to the file
-            with open(self.history_file, 'a') as f:
-                yaml.dump(edit_record, f, default_flow_style=False, sort_keys=False)
-                f.write("---\n")  # Document separator
+            # Keep the file in edit order if batched records are still queued
+            self.flush_batch()
+            # Simply append the new document to the buffered history file
+            self._history_fp.write(_format_edit(edit_record))
             
             self.logger.info(f"Recorded edit: {param_name} = {old_value} -> {new_value} (by {user} via {source})")
             return True
@@ -88,23 +337,100 @@ class SettingsEditingManager:
             self.logger.error(f"Failed to record edit: {e}")
             return False
         
+    def record_edit_batched(self, param_name: str, old_value: Any, new_value: Any,
+                            user: str = "unknown", source: str = "unknown") -> bool:
+        """
+        Queue a settings edit for a later flush_batch, for bulk changes such as imports.
+        The queue is written out automatically once it holds BATCH_MAX_RECORDS records
+        or BATCH_MAX_BYTES bytes.
+        
+        Args:
+            Same as record_edit
+            
+        Returns:
+            bool: True if successfully queued, False otherwise
+        """
+        try:
+            edit_record = self._make_edit_record(param_name, old_value, new_value, user, source)
+            data = _format_edit(edit_record).encode()
+            self._pending.append(data)
+            self._pending_size += len(data)
+            
+            if len(self._pending) >= BATCH_MAX_RECORDS or self._pending_size >= BATCH_MAX_BYTES:
+                self.flush_batch()
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Failed to record edit: {e}")
+            return False
+
+    def flush_batch(self):
+        """Write all queued batch records to the history file in a single write"""
+        if not self._pending:
+            return
+        # Records from record_edit may still sit in the file buffer, write those first
+        self._history_fp.flush()
+        fd = self._history_fp.fileno()
+        total = self._pending_size
+        written = os.writev(fd, self._pending) if hasattr(os, 'writev') else 0
+        if written < total:
+            rest = b"".join(self._pending)[written:]
+            while rest:
+                rest = rest[os.write(fd, rest):]
+        self.logger.info(f"Recorded {len(self._pending)} batched edits")
+        self._pending.clear()
+        self._pending_size = 0
+        
+    def recent_edits(self, k: int = 20) -> List[Dict[str, Any]]:
+        """
+        Get the last k edit records, oldest first.
+        Only the tail of the history file is scanned and parsed, so the cost does not
+        grow with the length of the history.
+        
+        Args:
+            k: Maximum number of records to return
+            
+        Returns:
+            list: Edit records as dicts, the history header is never included
+        """
+        self.flush()
+        if k <= 0 or os.path.getsize(self.history_file) == 0:
+            return []
+
+        docs = []
+        with open(self.history_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = mm.size()
+            if mm[end - 4:end] == b"---\n":
+                end -= 4
+            while len(docs) < k and end > 0:
+                sep = mm.rfind(b"\n---\n", 0, end)
+                if sep == -1:
+                    # Reached the first document, which is the history header
+                    break
+                doc = yaml.load(mm[sep + 5:end], Loader=SafeLoader)
+                if doc:
+                    docs.append(doc)
+                end = sep + 1
+        docs.reverse()
+        return docs
+
     def clear_history(self) -> bool:
         """
-        Clear all edit history by recreating the file with just the header.
+        Clear all edit history by truncating the file back to just the header.
         
         Returns:
             bool: True if successfully cleared, False otherwise
         """
         try:
-            header = {
-                "version": "1.0",
-                "created_at": datetime.now().isoformat(),
-                "settings_file": self.settings_file,
-                "description": "Settings edit history log (YAML multi-document format)"
-            }
-            with open(self.history_file, 'w') as f:
-                yaml.dump(header, f, default_flow_style=False, sort_keys=False)
-                f.write("---\n")  # Document separator
+            # Queued records belong to the history being cleared
+            self._pending.clear()
+            self._pending_size = 0
+            # Truncate through the open handle so its fd stays valid for later appends
+            self._history_fp.flush()
+            os.ftruncate(self._history_fp.fileno(), 0)
+            self._history_fp.seek(0)
+            self._history_fp.write(self._history_header())
+            self._history_fp.flush()
             self.logger.info("Cleared edit history")
             return True
         except Exception as e:
@@ -127,8 +453,7 @@ class SettingsEditingManager:
                 backup_file = f"{self.settings_file}.backup_{timestamp}"
             
             if os.path.exists(self.settings_file):
-                import shutil
-                shutil.copy2(self.settings_file, backup_file)
+                _copy_file(self.settings_file, backup_file)
                 self.logger.info(f"Backed up settings to: {backup_file}")
                 return True
             else:
@@ -140,21 +465,57 @@ class SettingsEditingManager:
             return False
     
     def save_settings(self, settings: dict):
-        """Save the settings to the settings file"""
-        with open(self.settings_file, 'w') as f:
-            yaml.dump(settings, f, default_flow_style=False, sort_keys=False)
+        """Save the settings to the settings file
 
-    def get_editable_current_settings(self) -> dict:
-        """Get the current settings"""
-        settings_dict = {}  
-        self.settings = self.get_settings()
-        for param in self.editable_params_list:
-            param['value'] = self.get_parameter_value(self.settings, param['path'])
-            settings_dict[param['name']] = param['value']
-        return settings_dict
+        The YAML is rendered in memory, written to a temporary file in one write and
+        moved over the settings file, so a crash never leaves a half written file.
+        """
+        buf = io.StringIO()
+        _dump(settings, buf)
+        data = buf.getvalue().encode()
+
+        # A unique temp file, so concurrent saves never share one
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(self.settings_file) or '.',
+                                        prefix=os.path.basename(self.settings_file) + '.', suffix='.tmp')
+        try:
+            with open(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.settings_file):
+                # Keep the mode and owner of the file being replaced, as an in-place write would
+                st = os.stat(self.settings_file)
+                os.chmod(tmp_file, st.st_mode)
+                try:
+                    os.chown(tmp_file, st.st_uid, st.st_gid)
+                except PermissionError:
+                    # Only root can hand the file to another owner
+                    pass
+            else:
+                # mkstemp creates 0600, use the default mode a plain open() would give
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(tmp_file, 0o666 & ~umask)
+            os.replace(tmp_file, self.settings_file)
+        except BaseException:
+            # Don't leave a half-written temp file next to the settings
+            try:
+                os.unlink(tmp_file)
+            except FileNotFoundError:
+                pass
+            raise
+        cache_settings(self.settings_file, settings)
+
+    def get_editable_current_settings(self, refresh: bool = False) -> Mapping[str, Any]:
+        """Get the current editable settings as a read-only name -> value mapping, use dict() on it for a copy"""
+        # Read only, served from the loader cache while the file is unchanged unless refresh is set
+        return _EditableView(self.get_settings(readonly=True, refresh=refresh), self._accessors_by_name)
     
     def get_parameter_value(self, settings: dict, path: list):
         """Get parameter value from settings using path"""
+        accessors = self._accessors_by_path.get(tuple(path))
+        if accessors:
+            return accessors[0](settings)
         current = settings
         for key in path:
             if isinstance(current, dict) and key in current:
@@ -165,13 +526,15 @@ class SettingsEditingManager:
     
     def get_parameter_info(self, param_name: str):
         """Get parameter info from editable_params_list"""
-        for param in self.editable_params_list:
-            if param['name'] == param_name:
-                return param
-        return None
+        param = EDITABLE_PARAMS.get(param_name)
+        return param.to_dict() if param else None
     
     def set_parameter_value(self, settings: dict, path: list, value):
         """Set parameter value in settings using path"""
+        accessors = self._accessors_by_path.get(tuple(path))
+        if accessors:
+            accessors[1](settings, value)
+            return
         current = settings
         for key in path[:-1]:
             if key not in current:
@@ -182,39 +545,14 @@ class SettingsEditingManager:
     def parse_parameter_value(self, param_name: str, value_str: str):
         """Parse parameter value based on parameter type"""
         try:
-            param_info = None
-            for param in self.editable_params_list:
-                if param['name'] == param_name:
-                    param_info = param
-                    break
+            param_info = EDITABLE_PARAMS.get(param_name)
             
             if not param_info:
                 raise ValueError(f"Unknown parameter: {param_name}")
             
-            param_type = param_info['type']
-            
-            if param_type == 'int':
-                return int(value_str)
-            elif param_type == 'float':
-                return float(value_str)
-            elif param_type == 'bool':
-                if value_str.lower() in ['true', '1', 'yes']:
-                    return True
-                elif value_str.lower() in ['false', '0', 'no']:
-                    return False
-                else:
-                    raise ValueError(f"Invalid boolean value: {value_str}")
-            elif param_type == 'string':
-                return value_str
-            elif param_type == 'list_float':
-                # Handle list format like [1.0, 2.0, 3.0] or "1.0,2.0,3.0"
-                if value_str.startswith('[') and value_str.endswith(']'):
-                    value_str = value_str[1:-1]
-                values = [float(x.strip()) for x in value_str.split(',') if x.strip()]
-                return values
-            else:
-                # Default to string
-                return value_str
+            # Unknown types default to string
+            parser = _PARSERS.get(param_info.type, _parse_string)
+            return parser(value_str)
         except Exception as e:
             raise ValueError(f"Failed to parse value '{value_str}' for parameter '{param_name}': {e}")
 
@@ -1,15 +1,53 @@
 import yaml
 import os
+import copy
+from utils.logging_helper import set_logger
 
-def load_settings(file_name):
-    """Load settings from settings_local.yaml or settings.yaml"""
+# libyaml backed loader when available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+logger = set_logger('SettingsLoader')
+
+# settings_file -> (st_mtime_ns, st_size, parsed settings)
+_CACHE: dict[str, tuple[int, int, dict]] = {}
+
+def load_settings(file_name, readonly=False, refresh=False):
+    """Load settings from settings_local.yaml or settings.yaml
+
+    The parsed file is cached until its mtime or size changes, refresh=True
+    forces a reparse. Callers get a deep copy they are free to mutate, pass
+    readonly=True to get the shared cached dict without copying.
+    """
     # Try to load local settings first, fall back to default settings
-    settings_file = file_name if os.path.exists(file_name) else 'settings.yaml'
-    
+    settings_file = file_name
     try:
-        with open(settings_file, 'r') as f:
-            settings = yaml.safe_load(f)
-        return settings
+        try:
+            f = open(settings_file, 'rb')
+        except FileNotFoundError:
+            settings_file = 'settings.yaml'
+            try:
+                f = open(settings_file, 'rb')
+            except FileNotFoundError:
+                logger.warning(f"Could not find {file_name} or {settings_file}")
+                return {}
+
+        with f:
+            st = os.fstat(f.fileno())
+            cached = _CACHE.get(settings_file)
+            if cached and not refresh and cached[:2] == (st.st_mtime_ns, st.st_size):
+                settings = cached[2]
+            else:
+                settings = yaml.load(f, Loader=SafeLoader) or {}
+                _CACHE[settings_file] = (st.st_mtime_ns, st.st_size, settings)
+        return settings if readonly else copy.deepcopy(settings)
     except Exception as e:
-        print(f"Warning: Could not load {settings_file}: {e}")
-        return {} 
\ No newline at end of file
+        logger.warning(f"Could not load {settings_file}: {e}")
+        return {}
+
+def cache_settings(file_name, settings):
+    """Record settings just written to file_name so the next load skips reparsing it"""
+    st = os.stat(file_name)
+    _CACHE[file_name] = (st.st_mtime_ns, st.st_size, copy.deepcopy(settings))